@@ -0,0 +1,455 @@
+import os
+import json
+import time
+import bisect
+import socket
+import hashlib
+import logging
+import threading
+import uuid
+from typing import Callable
+from fs2elastic.dataset_processor import get_file_id
+from fs2elastic.typings import Config
+
+
+# Number of points every node gets on the consistent hashing ring. More points spread the files more
+# evenly between nodes.
+VIRTUAL_NODES = 64
+
+
+def ring_hash(value: str) -> int:
+    """
+    The function `ring_hash` maps a value to a position on the consistent hashing ring.
+
+    :param value: The `value` parameter is a node point or a file path
+    :type value: str
+    :return: An integer position on the ring.
+    """
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+# The `ClusterCoordinator` class lets several fs2elastic instances share a source directory. Files are
+# split between the live nodes by consistent hashing of their path, leases make sure a file is synced
+# by one node at a time and the synced state is shared, all through files in `cluster_state_dir`.
+class ClusterCoordinator:
+
+    def __init__(self, config: Config, node_suffix: str = ""):
+        """
+        The function initializes the coordinator with the cluster settings and the layout of the shared
+        state directory.
+
+        :param config: The `config` parameter is of type `Config` and holds the cluster settings. When
+        `cluster_state_dir` is empty a `.fs2elastic-cluster` directory in the source directory is used,
+        and when `cluster_node_id` is empty the host name and process id are used
+        :type config: Config
+        :param node_suffix: The `node_suffix` parameter is appended to the node id, so a process sharing
+        the configuration file of a daemon, like a backfill run, does not use the daemon's node id
+        :type node_suffix: str
+        """
+        self.config = config
+        self.node_id = (
+            config.cluster_node_id or f"{socket.gethostname()}-{os.getpid()}"
+        ) + node_suffix
+        self.state_dir = config.cluster_state_dir or os.path.join(
+            config.dataset_source_dir, ".fs2elastic-cluster"
+        )
+        self.nodes_dir = os.path.join(self.state_dir, "nodes")
+        self.leases_dir = os.path.join(self.state_dir, "leases")
+        self.files_dir = os.path.join(self.state_dir, "files")
+        self.held_leases: set[str] = set()
+        self.nodes: list[str] = []
+        self.ring: list[tuple[int, str]] = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.heartbeat_thread: threading.Thread | None = None
+        self.member = True
+
+    def start(
+        self,
+        on_rebalance: Callable[[set[str]], None] | None = None,
+        member: bool = True,
+    ) -> None:
+        """
+        The `start` method joins the cluster and starts the heartbeat thread.
+
+        :param on_rebalance: The `on_rebalance` parameter is called from the heartbeat thread with the
+        nodes which left whenever the set of live nodes changes, including when joining, so the node can
+        pick up the files it now owns. It must return quickly and leave the work to another thread
+        :type on_rebalance: Callable[[set[str]], None] | None
+        :param member: The `member` parameter tells if the node takes a share of the files. A node which
+        is not a member, like a backfill run, only takes leases and renews them, and owns no file
+        :type member: bool
+        """
+        self.member = member
+        for directory in (self.nodes_dir, self.leases_dir, self.files_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.heartbeat()
+        self.heartbeat_thread = threading.Thread(
+            target=self.run_heartbeat,
+            args=(on_rebalance,),
+            name="cluster-heartbeat",
+            daemon=True,
+        )
+        self.heartbeat_thread.start()
+        logging.info(
+            f"CLUSTER_JOINED: {self.node_id} {self.state_dir}"
+            f"{'' if member else ' (leases only)'}."
+        )
+
+    def stop(self) -> None:
+        """
+        The `stop` method leaves the cluster. The heartbeat and the held leases are removed so the
+        other nodes take over right away instead of waiting for them to expire.
+        """
+        self.stopped.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join()
+        for file_id in list(self.held_leases):
+            self.release_lease_file(file_id)
+        # A node which is not a member never wrote a heartbeat.
+        if self.member:
+            try:
+                os.remove(os.path.join(self.nodes_dir, self.node_id))
+            except FileNotFoundError:
+                pass
+        logging.info(f"CLUSTER_LEFT: {self.node_id}.")
+
+    def heartbeat(self) -> set[str] | None:
+        """
+        The `heartbeat` method renews the node heartbeat and the held leases and refreshes the hashing
+        ring from the live nodes.
+
+        :return: `None` if the set of live nodes did not change, the set of nodes which left otherwise.
+        """
+        with self.lock:
+            for file_id in self.held_leases:
+                try:
+                    os.utime(os.path.join(self.leases_dir, file_id))
+                except FileNotFoundError:
+                    pass
+        if not self.member:
+            return None
+        heartbeat_path = os.path.join(self.nodes_dir, self.node_id)
+        with open(heartbeat_path, "a"):
+            os.utime(heartbeat_path)
+        now = time.time()
+        nodes = sorted(
+            entry.name
+            for entry in os.scandir(self.nodes_dir)
+            if entry.name == self.node_id
+            or now - entry.stat().st_mtime < self.config.cluster_lease_ttl
+        )
+        if nodes == self.nodes:
+            return None
+        departed = set(self.nodes) - set(nodes)
+        self.ring = sorted(
+            (ring_hash(f"{node}#{point}"), node)
+            for node in nodes
+            for point in range(VIRTUAL_NODES)
+        )
+        self.nodes = nodes
+        logging.info(f"CLUSTER_MEMBERSHIP: {self.node_id} sees {nodes}.")
+        return departed
+
+    def run_heartbeat(self, on_rebalance: Callable[[set[str]], None] | None) -> None:
+        """
+        The `run_heartbeat` method renews the heartbeat every `cluster_heartbeat_interval` seconds until
+        the coordinator is stopped, and triggers `on_rebalance` on membership changes.
+
+        :param on_rebalance: The `on_rebalance` parameter is the callback picking up owned files
+        :type on_rebalance: Callable[[set[str]], None] | None
+        """
+        if on_rebalance:
+            on_rebalance(set())
+        while not self.stopped.wait(self.config.cluster_heartbeat_interval):
+            try:
+                departed = self.heartbeat()
+                if departed is not None and on_rebalance:
+                    on_rebalance(departed)
+            except Exception as e:
+                logging.error(f"CLUSTER_HEARTBEAT_FAILED: {self.node_id}: {e}")
+
+    def owner(self, path: str, ring: list[tuple[int, str]] | None = None) -> str:
+        """
+        The `owner` method returns the live node owning a file on the consistent hashing ring.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :param ring: The `ring` parameter is an earlier hashing ring to look the owner up in. It defaults
+        to the current ring
+        :type ring: list[tuple[int, str]] | None
+        :return: The node id of the owner. Before the ring is built, this node is assumed to own every
+        file; the lease still keeps the sync exclusive.
+        """
+        ring = self.ring if ring is None else ring
+        if not ring:
+            return self.node_id
+        index = bisect.bisect(ring, (ring_hash(path), "")) % len(ring)
+        return ring[index][1]
+
+    def is_owner(self, path: str) -> bool:
+        """
+        The `is_owner` method checks if this node owns a file.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :return: `True` if the file is owned by this node, `False` otherwise.
+        """
+        return self.owner(path) == self.node_id
+
+    def acquire_lease(self, path: str) -> bool:
+        """
+        The `acquire_lease` method takes the lease of a file before syncing it. The lease file is created
+        exclusively (`O_EXCL`), so only one node can hold it. A lease not renewed for `cluster_lease_ttl`
+        seconds belongs to a dead node and is taken over with `take_over_lease`.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :return: `True` if the lease was acquired, `False` if another sync holds it.
+        """
+        file_id = get_file_id(path)
+        lease_path = os.path.join(self.leases_dir, file_id)
+        if not self.create_exclusive(lease_path):
+            if not self.is_expired(lease_path) or not self.take_over_lease(lease_path):
+                return False
+            logging.info(f"CLUSTER_LEASE_TAKEOVER: {self.node_id} {path}.")
+        with self.lock:
+            self.held_leases.add(file_id)
+        return True
+
+    def create_exclusive(self, path: str) -> bool:
+        """
+        The `create_exclusive` method atomically creates a file holding the node id, failing if it
+        already exists.
+
+        :param path: The `path` parameter is the path of the file to create
+        :type path: str
+        :return: `True` if this node created the file, `False` if it already existed.
+        """
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.node_id)
+        return True
+
+    def is_expired(self, path: str) -> bool:
+        """
+        The `is_expired` method checks if a lease or takeover file was not renewed for
+        `cluster_lease_ttl` seconds.
+
+        :param path: The `path` parameter is the path of the file
+        :type path: str
+        :return: `True` if the file exists and is expired, `False` otherwise.
+        """
+        try:
+            return time.time() - os.path.getmtime(path) >= self.config.cluster_lease_ttl
+        except FileNotFoundError:
+            return False
+
+    def remove_stale(self, path: str) -> None:
+        """
+        The `remove_stale` method removes an expired file. It is renamed to a unique name first, which
+        only one node can do, and put back if it turns out to have been replaced by a fresh file in the
+        meantime.
+
+        :param path: The `path` parameter is the path of the expired file
+        :type path: str
+        """
+        unique_path = f"{path}.{uuid.uuid4().hex}"
+        try:
+            os.rename(path, unique_path)
+        except FileNotFoundError:
+            return
+        if not self.is_expired(unique_path):
+            try:
+                os.link(unique_path, path)
+            except FileExistsError:
+                pass
+        os.remove(unique_path)
+
+    def take_over_lease(self, lease_path: str) -> bool:
+        """
+        The `take_over_lease` method replaces an expired lease by a lease of this node.
+
+        Takeovers of a lease are serialized by an exclusively created `<lease>.takeover` file. Its holder
+        checks again that the lease is still expired before removing it, and then competes for the lease
+        with `O_EXCL` like any other node. So two nodes that both saw the lease expired can never both
+        hold it: the second one to get the takeover file finds the fresh lease of the first one.
+
+        A takeover file left behind by a node that died during a takeover is removed once it is older
+        than `cluster_lease_ttl`, by renaming it to a unique name so only one node removes it.
+
+        :param lease_path: The `lease_path` parameter is the path of the expired lease
+        :type lease_path: str
+        :return: `True` if this node now holds the lease, `False` otherwise.
+        """
+        takeover_path = f"{lease_path}.takeover"
+        if not self.create_exclusive(takeover_path):
+            if self.is_expired(takeover_path):
+                self.remove_stale(takeover_path)
+            return False
+        try:
+            if not self.is_expired(lease_path):
+                return False
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+            return self.create_exclusive(lease_path)
+        finally:
+            try:
+                os.remove(takeover_path)
+            except FileNotFoundError:
+                pass
+
+    def release_lease(self, path: str) -> None:
+        """
+        The `release_lease` method gives the lease of a file back once its sync is over.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        """
+        self.release_lease_file(get_file_id(path))
+
+    def release_lease_file(self, file_id: str) -> None:
+        """
+        The `release_lease_file` method removes a lease file held by this node.
+
+        :param file_id: The `file_id` parameter identifies the leased file, see `get_file_id`
+        :type file_id: str
+        """
+        with self.lock:
+            self.held_leases.discard(file_id)
+        try:
+            os.remove(os.path.join(self.leases_dir, file_id))
+        except FileNotFoundError:
+            pass
+
+    def is_state_path(self, path: str) -> bool:
+        """
+        The `is_state_path` method checks if a path lies within the cluster state directory, whose files
+        must never be synced as datasets.
+
+        :param path: The `path` parameter is the path to check
+        :type path: str
+        :return: `True` if the path is the state directory or lies within it, `False` otherwise.
+        """
+        state_dir = os.path.abspath(self.state_dir)
+        return os.path.commonpath([state_dir, os.path.abspath(path)]) == state_dir
+
+    def state_path(self, path: str) -> str:
+        """
+        The `state_path` method returns the shared state file of a source file. State files are spread
+        over sub directories to keep directories small.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :return: The path of the state file.
+        """
+        file_id = get_file_id(path)
+        return os.path.join(self.files_dir, file_id[:2], f"{file_id}.json")
+
+    def get_state(self, path: str) -> dict | None:
+        """
+        The `get_state` method returns the shared synced state of a file.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :return: A dictionary with the `hash`, `size` and `mtime` of the synced content and the `node`
+        that synced it, or `None` if the file was never synced.
+        """
+        try:
+            with open(self.state_path(path)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def set_state(self, path: str, state: dict) -> None:
+        """
+        The `set_state` method atomically writes the shared synced state of a file.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :param state: The `state` parameter is the state to write, see `get_state`
+        :type state: dict
+        """
+        state_path = self.state_path(path)
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        tmp_path = f"{state_path}.{self.node_id}"
+        with open(tmp_path, "w") as f:
+            json.dump({**state, "path": path, "node": self.node_id}, f)
+        os.replace(tmp_path, state_path)
+
+    def mark_synced(self, path: str, file_hash: str) -> None:
+        """
+        The `mark_synced` method records that a file was synced with the given content.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :param file_hash: The `file_hash` parameter is the md5 hash of the synced content
+        :type file_hash: str
+        """
+        stat = os.stat(path)
+        self.set_state(
+            path,
+            {"hash": file_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+        )
+
+    def synced_hash(self, path: str) -> str | None:
+        """
+        The `synced_hash` method returns the content hash a file was last synced with.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :return: The md5 hash or `None` if the file was never synced.
+        """
+        state = self.get_state(path)
+        return state["hash"] if state else None
+
+    def is_unchanged(self, path: str, stat: tuple[int, int] | None = None) -> bool:
+        """
+        The `is_unchanged` method cheaply checks, from size and mtime, if a file is still in the state
+        it was synced in. It is used to rescan owned files without hashing them.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        :param stat: The `stat` parameter is the size and mtime in nanoseconds of the file when they are
+        already known, e.g. from the scanner index. The file is stat'ed otherwise
+        :type stat: tuple[int, int] | None
+        :return: `True` if the file was synced and did not change since, `False` otherwise.
+        """
+        state = self.get_state(path)
+        if not state:
+            return False
+        if stat is None:
+            file_stat = os.stat(path)
+            stat = file_stat.st_size, file_stat.st_mtime_ns
+        return (state["size"], state.get("mtime_ns")) == stat
+
+    def forget(self, path: str) -> None:
+        """
+        The `forget` method drops the shared state of a deleted file.
+
+        :param path: The `path` parameter is the path of the source file
+        :type path: str
+        """
+        try:
+            os.remove(self.state_path(path))
+        except FileNotFoundError:
+            pass
+
+    def move_state(self, src_path: str, dest_path: str) -> None:
+        """
+        The `move_state` method moves the shared state of a renamed file to its new path.
+
+        :param src_path: The `src_path` parameter is the old path of the file
+        :type src_path: str
+        :param dest_path: The `dest_path` parameter is the new path of the file
+        :type dest_path: str
+        """
+        state = self.get_state(src_path)
+        if state:
+            self.set_state(dest_path, state)
+            self.forget(src_path)
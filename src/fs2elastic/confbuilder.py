@@ -1,20 +1,39 @@
 import os
 import toml
+from functools import partial
 from pathlib import Path
-from fs2elastic.typings import Config, AppConfig, DatasetConfig, ESConfig, LogConfig
+from fs2elastic.typings import (
+    Config,
+    AppConfig,
+    DatasetConfig,
+    ESConfig,
+    LogConfig,
+    ClusterConfig,
+)
 
 
 # The `defaults` dictionary is being initialized with key-value pairs where the keys represent
-# different configuration types ("AppConfig", "DatasetConfig", "ESConfig", "LogConfig") and the values
-# are the default configurations for each type obtained by calling the `model_dump()` method on
-# instances of the respective configuration classes (`AppConfig`, `DatasetConfig`, `ESConfig`,
-# `LogConfig`). These default configurations will be used as fallback values when specific
-# configuration keys are not found in the configuration file or environment variables.
+# different configuration types ("AppConfig", "DatasetConfig", "ESConfig", "LogConfig", "ClusterConfig")
+# and the values are the default configurations for each type obtained by calling the `model_dump()`
+# method on instances of the respective configuration classes (`AppConfig`, `DatasetConfig`,
+# `ESConfig`, `LogConfig`, `ClusterConfig`). These default configurations will be used as fallback
+# values when specific configuration keys are not found in the configuration file or environment
+# variables.
 defaults = {
     "AppConfig": AppConfig().model_dump(),
     "DatasetConfig": DatasetConfig().model_dump(),
     "ESConfig": ESConfig().model_dump(),
     "LogConfig": LogConfig().model_dump(),
+    "ClusterConfig": ClusterConfig().model_dump(),
+}
+
+# Maps configuration key prefixes to the configuration file section holding them.
+config_sections = {
+    "app_": "AppConfig",
+    "dataset_": "DatasetConfig",
+    "es_": "ESConfig",
+    "log_": "LogConfig",
+    "cluster_": "ClusterConfig",
 }
 
 
@@ -36,6 +55,7 @@ def conf_initializer(config_file_path: str) -> str:
             "DatasetConfig": {**defaults["DatasetConfig"]},
             "ESConfig": {**defaults["ESConfig"]},
             "LogConfig": {**defaults["LogConfig"]},
+            "ClusterConfig": {**defaults["ClusterConfig"]},
         }
         toml.dump(config, file)
         file.close()
@@ -43,7 +63,19 @@ def conf_initializer(config_file_path: str) -> str:
     return config_file_path
 
 
-def get_value_of(key: str, config_file_path):
+def load_toml_config(config_file_path: str) -> dict:
+    """
+    The function `load_toml_config` reads and parses a TOML configuration file.
+
+    :param config_file_path: The `config_file_path` parameter is the path to the configuration file
+    :type config_file_path: str
+    :return: The parsed configuration as a dictionary keyed by section.
+    """
+    with open(config_file_path, "r") as f:
+        return toml.load(f)
+
+
+def get_value_of(key: str, config_file_path, toml_config: dict | None = None):
     """
     The function `get_value_of` reads a configuration file and retrieves values based on the provided
     key prefix.
@@ -57,36 +89,24 @@ def get_value_of(key: str, config_file_path):
     to the configuration file from which the function reads the configuration settings. This file is
     expected to be in TOML format and contains configurations for different sections like `AppConfig`,
     `DatasetConfig`, `ESConfig`,
+    :param toml_config: The `toml_config` parameter is the already parsed configuration file. When it is
+    provided the file at `config_file_path` is not read again
+    :type toml_config: dict | None
     :return: The function `get_value_of` reads a configuration file specified by `config_file_path` and
     returns the value associated with the given `key`. Depending on the prefix of the key (e.g., "app_",
     "dataset_", "es_", "log_"), it looks up the corresponding section in the configuration file
     (`toml_config`) and returns the value associated with that key. If the key
     """
     # Read configuration from  ~/.fs2elastic/fs2elastic.conf
-    with open(config_file_path, "r") as f:
-        toml_config = toml.load(f)
-    if key.startswith("app_"):
-        try:
-            return os.getenv(f"FS2ES_{key.upper()}", toml_config["AppConfig"][key])
-        except KeyError:
-            return defaults["AppConfig"][key]
-    elif key.startswith("dataset_"):
-        try:
-            return os.getenv(f"FS2ES_{key.upper()}", toml_config["DatasetConfig"][key])
-        except KeyError:
-            return defaults["DatasetConfig"][key]
-    elif key.startswith("es_"):
-        try:
-            return os.getenv(f"FS2ES_{key.upper()}", toml_config["ESConfig"][key])
-        except KeyError:
-            return defaults["ESConfig"][key]
-    elif key.startswith("log_"):
-        try:
-            return os.getenv(f"FS2ES_{key.upper()}", toml_config["LogConfig"][key])
-        except KeyError:
-            return defaults["LogConfig"][key]
-    else:
-        raise ValueError(f"Unknown Key {key}")
+    if toml_config is None:
+        toml_config = load_toml_config(config_file_path)
+    for prefix, section in config_sections.items():
+        if key.startswith(prefix):
+            return os.getenv(
+                f"FS2ES_{key.upper()}",
+                toml_config.get(section, {}).get(key, defaults[section][key]),
+            )
+    raise ValueError(f"Unknown Key {key}")
 
 
 def toml_conf_reader(config_file_path: str) -> Config:
@@ -100,35 +120,48 @@ def toml_conf_reader(config_file_path: str) -> Config:
     `get_value_of` function is used to retrieve the
     :type config_file_path: str
     :return: An instance of the `Config` class with various attributes initialized with values read from
-    a TOML configuration file specified by the `config_file_path`.
+    a TOML configuration file specified by the `config_file_path`. The file is parsed once.
     """
-
+    toml_config = load_toml_config(config_file_path)
+    value_of = partial(
+        get_value_of, config_file_path=config_file_path, toml_config=toml_config
+    )
     config = Config(
-        app_home=Path(get_value_of("app_home", config_file_path)),
-        app_config_file_path=get_value_of("app_config_file_path", config_file_path),
-        dataset_source_dir=Path(get_value_of("dataset_source_dir", config_file_path)),
-        dataset_supported_file_extensions=get_value_of(
-            "dataset_supported_file_extensions", config_file_path
-        ),
-        dataset_max_workers=get_value_of("dataset_max_workers", config_file_path),
-        dataset_threads_per_worker=get_value_of(
-            "dataset_threads_per_worker", config_file_path
+        app_home=Path(value_of("app_home")),
+        app_config_file_path=value_of("app_config_file_path"),
+        dataset_source_dir=Path(value_of("dataset_source_dir")),
+        dataset_supported_file_extensions=value_of(
+            "dataset_supported_file_extensions"
         ),
-        dataset_chunk_size=get_value_of("dataset_chunk_size", config_file_path),
-        es_hosts=get_value_of("es_hosts", config_file_path),
-        es_username=get_value_of("es_username", config_file_path),
-        es_password=get_value_of("es_password", config_file_path),
-        es_timeout=get_value_of("es_timeout", config_file_path),
-        es_index_prefix=get_value_of("es_index_prefix", config_file_path),
-        es_ssl_ca=get_value_of("es_ssl_ca", config_file_path),
-        es_verify_certs=get_value_of("es_verify_certs", config_file_path),
-        log_file_path=get_value_of("log_file_path", config_file_path),
+        dataset_max_workers=value_of("dataset_max_workers"),
+        dataset_threads_per_worker=value_of("dataset_threads_per_worker"),
+        dataset_chunk_size=value_of("dataset_chunk_size"),
+        dataset_observer=value_of("dataset_observer"),
+        dataset_scan_interval=int(value_of("dataset_scan_interval")),
+        dataset_scan_threads=int(value_of("dataset_scan_threads")),
+        dataset_scan_io_budget=int(value_of("dataset_scan_io_budget")),
+        dataset_scan_full_every=int(value_of("dataset_scan_full_every")),
+        es_hosts=value_of("es_hosts"),
+        es_username=value_of("es_username"),
+        es_password=value_of("es_password"),
+        es_timeout=value_of("es_timeout"),
+        es_index_prefix=value_of("es_index_prefix"),
+        es_index_strategy=value_of("es_index_strategy"),
+        es_index_template=value_of("es_index_template"),
+        es_ssl_ca=value_of("es_ssl_ca"),
+        es_verify_certs=value_of("es_verify_certs"),
+        log_file_path=value_of("log_file_path"),
         log_max_size=int(
-            get_value_of("log_max_size", config_file_path),
+            value_of("log_max_size"),
         ),
         log_backup_count=int(
-            get_value_of("log_backup_count", config_file_path),
+            value_of("log_backup_count"),
         ),
+        cluster_enabled=value_of("cluster_enabled"),
+        cluster_node_id=value_of("cluster_node_id"),
+        cluster_state_dir=value_of("cluster_state_dir"),
+        cluster_lease_ttl=int(value_of("cluster_lease_ttl")),
+        cluster_heartbeat_interval=int(value_of("cluster_heartbeat_interval")),
     )
     return config
 
@@ -1,4 +1,4 @@
-import os, string, re, math
+import os, string, re, math, hashlib, pathlib
 import pandas as pd
 from typing import Any, Generator
 from threading import current_thread
@@ -6,10 +6,77 @@ import logging
 from datetime import datetime
 import pytz
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from fs2elastic.es_handler import put_es_bulk
+from fs2elastic.es_handler import (
+    put_es_bulk,
+    create_es_index,
+    swap_es_alias,
+    delete_es_index,
+    delete_es_documents,
+)
 from fs2elastic.typings import Config
 
 
+def sanitize_index_part(value: str) -> str:
+    """
+    The function `sanitize_index_part` strips punctuation and spaces from a value so it can be used as
+    a part of an Elasticsearch index name.
+
+    :param value: The `value` parameter is the string to sanitize, e.g. a file path or directory name
+    :type value: str
+    :return: The value without punctuation and spaces.
+    """
+    return str(re.sub("[" + re.escape(string.punctuation) + "]", "", value)).replace(
+        " ", ""
+    )
+
+
+def get_index_name(source_file: str, config: Config) -> str:
+    """
+    The function `get_index_name` derives the Elasticsearch index name of a source file from its path
+    according to the configured `es_index_strategy`.
+
+    With the `file` strategy every file gets its own index name made of the prefix and the file path.
+    With the `shared` and `data_stream` strategies the name is rendered from `es_index_template`, which
+    accepts the placeholders `{prefix}`, `{dir}` (parent directory relative to the source directory),
+    `{top_dir}` (first directory below the source directory), `{name}` (file name without extension)
+    and `{ext}` (file extension).
+
+    :param source_file: The `source_file` parameter is the path of the source file. The file does not
+    need to exist, which allows resolving the index of a deleted or moved file
+    :type source_file: str
+    :param config: The `config` parameter is of type `Config` and provides the index settings
+    :type config: Config
+    :return: The lowercased index, alias or data stream name for the source file.
+    """
+    if config.es_index_strategy == "file":
+        return f"{config.es_index_prefix}{sanitize_index_part(source_file)}".lower()
+    path = pathlib.PurePath(source_file)
+    try:
+        path = path.relative_to(config.dataset_source_dir)
+    except ValueError:
+        pass
+    return config.es_index_template.format(
+        prefix=config.es_index_prefix,
+        dir=sanitize_index_part(str(path.parent)),
+        top_dir=sanitize_index_part(path.parts[0] if len(path.parts) > 1 else ""),
+        name=sanitize_index_part(path.stem),
+        ext=sanitize_index_part(path.suffix),
+    ).lower()
+
+
+def get_file_id(source_file: str) -> str:
+    """
+    The function `get_file_id` returns a stable identifier of a source file path. It is stored in
+    `fs2e_meta.file_id` and used as routing key, so documents of different files sharing an index can be
+    told apart.
+
+    :param source_file: The `source_file` parameter is the path of the source file
+    :type source_file: str
+    :return: The md5 hex digest of the path.
+    """
+    return hashlib.md5(source_file.encode()).hexdigest()
+
+
 class DatasetProcessor:
     def __init__(self, source_file: str, config: Config, event_id: str) -> None:
         """
@@ -33,6 +100,7 @@ class DatasetProcessor:
         self.source_file = source_file
         self.config = config
         self.event_id = event_id
+        self.row_count = 0
         self.meta = {
             "created_at": datetime.fromtimestamp(
                 os.path.getctime(source_file), tz=pytz.UTC
@@ -41,8 +109,17 @@ class DatasetProcessor:
                 os.path.getmtime(source_file), tz=pytz.UTC
             ),
             "source_path": source_file,
-            "index": f"{self.config.es_index_prefix}{str(re.sub('['+re.escape(string.punctuation)+']', '',source_file)).replace(' ', '')}".lower(),
+            "index": get_index_name(source_file=source_file, config=config),
+            "file_id": get_file_id(source_file),
+            "version": datetime.now(tz=pytz.UTC).strftime("%Y%m%d%H%M%S%f"),
         }
+        # With the `file` strategy a full reload goes to a fresh versioned index which replaces the
+        # previous one behind the `index` alias once the load completes.
+        self.write_index = (
+            f"{self.meta['index']}-{self.meta['version']}"
+            if self.config.es_index_strategy == "file"
+            else self.meta["index"]
+        )
 
     def df(self) -> pd.DataFrame:
         """
@@ -84,8 +161,8 @@ class DatasetProcessor:
             - "fs2e_meta": the value of self.meta
             - "timestamp": the current
         """
-        return {
-            "_index": self.meta["index"],
+        action = {
+            "_index": self.write_index,
             "_id": record["record_id"],
             "_source": {
                 "record": record,
@@ -93,6 +170,14 @@ class DatasetProcessor:
                 "@timestamp": datetime.now(tz=pytz.UTC),
             },
         }
+        if self.config.es_index_strategy != "file":
+            action["_id"] = (
+                f"{self.meta['file_id']}-{self.meta['version']}-{record['record_id']}"
+            )
+            action["_routing"] = self.meta["file_id"]
+        if self.config.es_index_strategy == "data_stream":
+            action["_op_type"] = "create"
+        return action
 
     def __generate_batches(
         self, max_batch_count: int
@@ -105,13 +190,17 @@ class DatasetProcessor:
         batches generated based on a certain criteria or constraint
         :type max_batch_count: int
         """
-        df_length = self.df().shape[0]
+        df = self.df()
+        df_length = df.shape[0]
+        self.row_count = df_length
         batch_count = math.ceil(
             df_length
             / (self.config.dataset_chunk_size * self.config.dataset_threads_per_worker)
         )
         if batch_count > max_batch_count:
             batch_count = max_batch_count
+        if batch_count == 0:
+            return
         logging.info(
             f"{self.event_id}: Dataset processing proceeding in {batch_count} batch(es) "
         )
@@ -119,7 +208,7 @@ class DatasetProcessor:
         extra_records = df_length % batch_count
 
         for i in range(batch_count):
-            yield self.df()[
+            yield df[
                 i * batch_size
                 + min(i, extra_records) : (i + 1) * batch_size
                 + min(i + 1, extra_records)
@@ -144,7 +233,7 @@ class DatasetProcessor:
         ):
             yield data_frame[i : i + self.config.dataset_chunk_size]
 
-    def process_chunk(self, chunk: pd.DataFrame) -> None:
+    def process_chunk(self, chunk: pd.DataFrame) -> bool:
         """
         The function processes a chunk of data by converting it to Elasticsearch bulk actions and pushing it
         to Elasticsearch, with error handling.
@@ -154,6 +243,7 @@ class DatasetProcessor:
         converting it into a dictionary format and then pushing it to Elasticsearch in bulk using the
         `put_es_bulk` function. If
         :type chunk: pd.DataFrame
+        :return: `True` if the chunk was pushed, `False` otherwise.
         """
         try:
             put_es_bulk(
@@ -162,12 +252,14 @@ class DatasetProcessor:
                     self.record_to_es_bulk_action, chunk.to_dict(orient="records")
                 ),
             )
+            return True
         except Exception as e:
             logging.error(
                 f"{self.event_id}: Error Pushing Chunk {current_thread().name}: {e}"
             )
+            return False
 
-    def process_batch(self, data_frame_batch: pd.DataFrame, batch_id: int) -> None:
+    def process_batch(self, data_frame_batch: pd.DataFrame, batch_id: int) -> bool:
         """
         The `process_batch` function processes a batch of data frames in parallel using ThreadPoolExecutor.
 
@@ -178,7 +270,9 @@ class DatasetProcessor:
         represents the identifier of the current batch being processed. It is used to uniquely identify the
         batch and can be helpful for tracking and logging purposes during batch processing
         :type batch_id: int
+        :return: `True` if every chunk of the batch was pushed, `False` otherwise.
         """
+        futures = []
         with ThreadPoolExecutor(
             max_workers=self.config.dataset_threads_per_worker,
             thread_name_prefix=f"{os.getpid()}:{batch_id}",
@@ -188,17 +282,22 @@ class DatasetProcessor:
                     break
                 else:
                     try:
-                        executor.submit(self.process_chunk, chunk)
+                        futures.append(executor.submit(self.process_chunk, chunk))
                     except Exception as e:
                         logging.error(
                             f"{self.event_id}: Error Requesting Chunk {chunk_id + 1}: {e}"
                         )
+                        return False
+        return all(future.result() for future in futures)
 
-    def process_dataframe(self):
+    def process_dataframe(self) -> bool:
         """
         The `process_dataframe` function uses a `ProcessPoolExecutor` to process batches of data in
         parallel.
+
+        :return: `True` if every batch was processed, `False` otherwise.
         """
+        futures = []
         with ProcessPoolExecutor(
             max_workers=self.config.dataset_max_workers
         ) as executor:
@@ -209,14 +308,67 @@ class DatasetProcessor:
                     break
                 else:
                     try:
-                        executor.submit(self.process_batch, batch, batch_id)
+                        futures.append(
+                            executor.submit(self.process_batch, batch, batch_id)
+                        )
                     except Exception as e:
                         logging.error(
                             f"{self.event_id}: Error Requesting Batch {batch_id + 1}: {e}"
                         )
+                        return False
+        return all(future.result() for future in futures)
 
-    def es_sync(self):
+    def es_sync(self) -> int:
         """
-        The `es_sync` function in Python likely processes a dataframe.
+        The `es_sync` function loads the dataframe into Elasticsearch and publishes it once every batch
+        succeeded, so queries never see a partially reloaded file.
+
+        With the `file` strategy the records go to a fresh versioned index which is swapped in behind the
+        file's alias atomically. With the `shared` and `data_stream` strategies the records are written
+        as a new version and the documents of the previous versions of the file are deleted afterwards;
+        this is not atomic, queries may see the rows of both versions until the deletion completes.
+        On any failure the partially written version is discarded and the previous data stays in place.
+
+        :return: The number of records loaded.
+        """
+        try:
+            if self.config.es_index_strategy == "file":
+                create_es_index(config=self.config, index=self.write_index)
+            if not self.process_dataframe():
+                raise Exception(f"{self.event_id}: Failed to load {self.source_file}")
+            if self.config.es_index_strategy == "file":
+                swap_es_alias(
+                    config=self.config, alias=self.meta["index"], index=self.write_index
+                )
+        except Exception:
+            self.discard()
+            raise
+        if self.config.es_index_strategy != "file":
+            delete_es_documents(
+                config=self.config,
+                index=self.write_index,
+                file_id=self.meta["file_id"],
+                exclude_version=self.meta["version"],
+            )
+        return self.row_count
+
+    def discard(self) -> None:
+        """
+        The `discard` method removes what a failed sync wrote: the versioned index with the `file`
+        strategy, the documents of the new version otherwise. Errors are logged so the original failure
+        is the one reported.
         """
-        self.process_dataframe()
+        try:
+            if self.config.es_index_strategy == "file":
+                delete_es_index(config=self.config, index=self.write_index)
+            else:
+                delete_es_documents(
+                    config=self.config,
+                    index=self.write_index,
+                    file_id=self.meta["file_id"],
+                    version=self.meta["version"],
+                )
+        except Exception as e:
+            logging.error(
+                f"{self.event_id}: Error Discarding Version {self.meta['version']}: {e}"
+            )
@@ -42,3 +42,301 @@ def put_es_bulk(config: Config, actions) -> None:
     """
     es_client = get_es_connection(config)
     helpers.bulk(client=es_client, actions=actions)
+
+
+def resolve_es_index(es_client: Elasticsearch, index: str) -> list[str]:
+    """
+    The function `resolve_es_index` resolves an index name or alias to the concrete index names behind
+    it.
+
+    :param es_client: The `es_client` parameter is an Elasticsearch client object used to query the
+    cluster for the index or alias
+    :type es_client: Elasticsearch
+    :param index: The `index` parameter is the index name or alias name that needs to be resolved
+    :type index: str
+    :return: A list of concrete index names. The list is empty if neither an index nor an alias with
+    the given name exists.
+    """
+    if not es_client.indices.exists(index=index):
+        return []
+    return list(es_client.indices.get(index=index).keys())
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def delete_es_index(config: Config, index: str) -> None:
+    """
+    The `delete_es_index` function deletes the index (or the indices behind an alias) holding the
+    documents of a source file, with retry functionality.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param index: The `index` parameter is the index name or alias of the source file whose documents
+    should be removed
+    :type index: str
+    """
+    es_client = get_es_connection(config)
+    for concrete_index in resolve_es_index(es_client, index):
+        es_client.indices.delete(index=concrete_index, ignore_unavailable=True)
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def move_es_index(
+    config: Config, src_index: str, dest_index: str, dest_path: str
+) -> None:
+    """
+    The `move_es_index` function re-points the documents of a renamed source file to its new name
+    without re-sending them. The index holding the documents is kept, an alias named after the new
+    path is pointed at it and the `fs2e_meta` of every document is updated in place.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param src_index: The `src_index` parameter is the index name or alias derived from the old path
+    of the source file
+    :type src_index: str
+    :param dest_index: The `dest_index` parameter is the index name derived from the new path of the
+    source file. It becomes an alias of the index holding the documents
+    :type dest_index: str
+    :param dest_path: The `dest_path` parameter is the new path of the source file, written to
+    `fs2e_meta.source_path` of every document
+    :type dest_path: str
+    """
+    es_client = get_es_connection(config)
+    concrete_indices = resolve_es_index(es_client, src_index)
+    if not concrete_indices or src_index == dest_index:
+        return
+    # A file previously synced at the destination path is being replaced.
+    for stale_index in resolve_es_index(es_client, dest_index):
+        if stale_index not in concrete_indices:
+            es_client.indices.delete(index=stale_index, ignore_unavailable=True)
+    actions = []
+    if es_client.indices.exists_alias(name=src_index):
+        actions.append({"remove": {"index": "*", "alias": src_index}})
+    for concrete_index in concrete_indices:
+        if concrete_index != dest_index:
+            actions.append({"add": {"index": concrete_index, "alias": dest_index}})
+    if actions:
+        es_client.indices.update_aliases(actions=actions)
+    es_client.update_by_query(
+        index=concrete_indices,
+        conflicts="proceed",
+        refresh=True,
+        script={
+            "source": "ctx._source.fs2e_meta.source_path = params.source_path; "
+            "ctx._source.fs2e_meta.index = params.index;",
+            "lang": "painless",
+            "params": {"source_path": dest_path, "index": dest_index},
+        },
+    )
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def create_es_index(config: Config, index: str) -> None:
+    """
+    The `create_es_index` function creates an empty index, with retry functionality. It is used for the
+    fresh versioned index of a full reload so the alias swap also works for files without records.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param index: The `index` parameter is the name of the index to create
+    :type index: str
+    """
+    es_client = get_es_connection(config)
+    if not es_client.indices.exists(index=index):
+        es_client.indices.create(index=index)
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def swap_es_alias(config: Config, alias: str, index: str) -> None:
+    """
+    The `swap_es_alias` function atomically points an alias at a freshly loaded index and removes the
+    indices previously behind it, with retry functionality. A legacy concrete index carrying the alias
+    name is replaced as well.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param alias: The `alias` parameter is the name queries use to reach the data of the source file
+    :type alias: str
+    :param index: The `index` parameter is the freshly loaded versioned index
+    :type index: str
+    """
+    es_client = get_es_connection(config)
+    es_client.indices.refresh(index=index)
+    actions = [
+        {"remove_index": {"index": concrete_index}}
+        for concrete_index in resolve_es_index(es_client, alias)
+        if concrete_index != index
+    ]
+    actions.append({"add": {"index": index, "alias": alias}})
+    es_client.indices.update_aliases(actions=actions)
+
+
+def file_id_query(
+    file_id: str, version: str | None = None, exclude_version: str | None = None
+) -> dict:
+    """
+    The function `file_id_query` builds the query matching the documents of a source file in a shared
+    index or data stream.
+
+    :param file_id: The `file_id` parameter is the identifier stored in `fs2e_meta.file_id`
+    :type file_id: str
+    :param version: The `version` parameter restricts the query to one load of the file
+    :type version: str | None
+    :param exclude_version: The `exclude_version` parameter excludes one load of the file
+    :type exclude_version: str | None
+    :return: An Elasticsearch bool query.
+    """
+    query = {"bool": {"filter": [{"term": {"fs2e_meta.file_id.keyword": file_id}}]}}
+    if version:
+        query["bool"]["filter"].append({"term": {"fs2e_meta.version.keyword": version}})
+    if exclude_version:
+        query["bool"]["must_not"] = [
+            {"term": {"fs2e_meta.version.keyword": exclude_version}}
+        ]
+    return query
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def delete_es_documents(
+    config: Config,
+    index: str,
+    file_id: str,
+    version: str | None = None,
+    exclude_version: str | None = None,
+) -> None:
+    """
+    The `delete_es_documents` function deletes the documents of a source file from a shared index or
+    data stream, with retry functionality.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param index: The `index` parameter is the shared index or data stream holding the documents
+    :type index: str
+    :param file_id: The `file_id` parameter identifies the source file, see `file_id_query`
+    :type file_id: str
+    :param version: The `version` parameter restricts the deletion to one load of the file
+    :type version: str | None
+    :param exclude_version: The `exclude_version` parameter keeps one load of the file, e.g. the one
+    that just completed
+    :type exclude_version: str | None
+    """
+    es_client = get_es_connection(config)
+    if not es_client.indices.exists(index=index):
+        return
+    es_client.delete_by_query(
+        index=index,
+        query=file_id_query(file_id, version=version, exclude_version=exclude_version),
+        conflicts="proceed",
+        refresh=True,
+    )
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def move_es_documents(
+    config: Config,
+    src_index: str,
+    dest_index: str,
+    src_file_id: str,
+    dest_file_id: str,
+    dest_path: str,
+) -> None:
+    """
+    The `move_es_documents` function re-points the documents of a renamed source file in a shared index
+    or data stream, with retry functionality. The documents are copied server side with the reindex API
+    when the new path maps to another index, under the routing and `_id` prefix of the new file id. No
+    record is re-sent by the client.
+
+    Reindex cannot write into the index it reads from, so when the new path maps to the same index the
+    documents are updated in place instead. Their `fs2e_meta` points to the new path, but `_routing` and
+    `_id` keep the old file id until the file is reloaded: searches routed by the new file id miss them.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    :param src_index: The `src_index` parameter is the index or data stream of the old path
+    :type src_index: str
+    :param dest_index: The `dest_index` parameter is the index or data stream of the new path
+    :type dest_index: str
+    :param src_file_id: The `src_file_id` parameter is the file identifier of the old path
+    :type src_file_id: str
+    :param dest_file_id: The `dest_file_id` parameter is the file identifier of the new path
+    :type dest_file_id: str
+    :param dest_path: The `dest_path` parameter is the new path of the source file
+    :type dest_path: str
+    """
+    es_client = get_es_connection(config)
+    if not es_client.indices.exists(index=src_index):
+        return
+    # A file previously synced at the destination path is being replaced.
+    if es_client.indices.exists(index=dest_index):
+        es_client.delete_by_query(
+            index=dest_index,
+            query=file_id_query(dest_file_id),
+            conflicts="proceed",
+            refresh=True,
+        )
+    script = {
+        "source": "ctx._source.fs2e_meta.source_path = params.source_path; "
+        "ctx._source.fs2e_meta.index = params.index; "
+        "ctx._source.fs2e_meta.file_id = params.file_id;",
+        "lang": "painless",
+        "params": {"source_path": dest_path, "index": dest_index, "file_id": dest_file_id},
+    }
+    if src_index == dest_index:
+        es_client.update_by_query(
+            index=src_index,
+            query=file_id_query(src_file_id),
+            script=script,
+            conflicts="proceed",
+            refresh=True,
+        )
+        return
+    # Documents are routed and identified by file id, so both follow the new file id.
+    script["source"] += (
+        " ctx._id = params.file_id + ctx._id.substring(params.src_file_id.length());"
+    )
+    script["params"]["src_file_id"] = src_file_id
+    es_client.reindex(
+        source={"index": src_index, "query": file_id_query(src_file_id)},
+        dest={
+            "index": dest_index,
+            "op_type": "create" if config.es_index_strategy == "data_stream" else "index",
+            "routing": f"={dest_file_id}",
+        },
+        script=script,
+        conflicts="proceed",
+        refresh=True,
+    )
+    es_client.delete_by_query(
+        index=src_index,
+        query=file_id_query(src_file_id),
+        conflicts="proceed",
+        refresh=True,
+    )
+
+
+@retry(tries=10, delay=1, backoff=2, max_delay=10)
+def put_es_data_stream_template(config: Config) -> None:
+    """
+    The `put_es_data_stream_template` function creates the index template turning every index name
+    starting with `es_index_prefix` into a data stream, unless it already exists. It is required by the
+    `data_stream` strategy.
+
+    :param config: The `config` parameter is an object of type `Config` containing the settings needed
+    to establish a connection to Elasticsearch
+    :type config: Config
+    """
+    es_client = get_es_connection(config)
+    template_name = f"{config.es_index_prefix}data-stream"
+    if es_client.indices.exists_index_template(name=template_name):
+        return
+    es_client.indices.put_index_template(
+        name=template_name,
+        index_patterns=[f"{config.es_index_prefix}*"],
+        data_stream={"allow_custom_routing": True},
+        priority=200,
+    )
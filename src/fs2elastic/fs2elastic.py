@@ -1,20 +1,41 @@
 import os
+import sys
+import signal
+import threading
 import pathlib
 import hashlib
 import time
 import json
 import fnmatch
+import itertools
 import uuid
 import logging
 import datetime
 from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Generator, Iterable
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileSystemEvent
+from watchdog.observers.api import BaseObserver, ObservedWatch
+from watchdog.events import (
+    FileSystemEventHandler,
+    FileSystemEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+)
 import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 import pkg_resources
-from fs2elastic.confbuilder import get_config
-from fs2elastic.dataset_processor import DatasetProcessor
-from fs2elastic.es_handler import get_es_connection
+from fs2elastic.cluster import ClusterCoordinator
+from fs2elastic.scanner import FileStat, ScanningObserver
+from fs2elastic.confbuilder import get_config, toml_conf_reader, defaults
+from fs2elastic.dataset_processor import DatasetProcessor, get_index_name, get_file_id
+from fs2elastic.es_handler import (
+    get_es_connection,
+    delete_es_index,
+    move_es_index,
+    delete_es_documents,
+    move_es_documents,
+    put_es_data_stream_template,
+)
 from fs2elastic.typings import Config
 
 
@@ -127,6 +148,79 @@ def process_event(config: Config, event: FileSystemEvent) -> bool:
         return False
 
 
+def process_delete_event(config: Config, event: FileSystemEvent) -> bool:
+    """
+    The function `process_delete_event` removes the Elasticsearch documents of a deleted source file.
+
+    :param config: The `config` parameter is of type `Config` and holds the Elasticsearch settings
+    :type config: Config
+    :param event: The `event` parameter is the `FileSystemEvent` of the deleted file
+    :type event: FileSystemEvent
+    :return: The function `process_delete_event` is returning a boolean value - `True` if the documents
+    were removed and `False` if an exception occurs.
+    """
+    event_id = uuid.uuid4().hex
+    try:
+        logging.info(f"DELETE_STARTED: {event_id} {event.src_path}.")
+        index = get_index_name(source_file=event.src_path, config=config)
+        if config.es_index_strategy == "file":
+            delete_es_index(config=config, index=index)
+        else:
+            delete_es_documents(
+                config=config, index=index, file_id=get_file_id(event.src_path)
+            )
+        logging.info(f"DELETE_FINISHED: {event_id} {event.src_path}.")
+        return True
+    except Exception as e:
+        logging.error(f"DELETE_FAILED: {event_id} {event.src_path}.")
+        logging.error(f"An unexpected error occurred: {e}")
+        return False
+
+
+def process_move_event(config: Config, event: FileSystemEvent) -> bool:
+    """
+    The function `process_move_event` re-points the Elasticsearch documents of a moved or renamed source
+    file to its new path without re-indexing its records.
+
+    :param config: The `config` parameter is of type `Config` and holds the Elasticsearch settings
+    :type config: Config
+    :param event: The `event` parameter is the `FileSystemEvent` of the moved file. Its `src_path` is the
+    old path and its `dest_path` is the new path
+    :type event: FileSystemEvent
+    :return: The function `process_move_event` is returning a boolean value - `True` if the documents
+    were re-pointed and `False` if an exception occurs.
+    """
+    event_id = uuid.uuid4().hex
+    try:
+        logging.info(f"MOVE_STARTED: {event_id} {event.src_path} -> {event.dest_path}.")
+        src_index = get_index_name(source_file=event.src_path, config=config)
+        dest_index = get_index_name(source_file=event.dest_path, config=config)
+        if config.es_index_strategy == "file":
+            move_es_index(
+                config=config,
+                src_index=src_index,
+                dest_index=dest_index,
+                dest_path=event.dest_path,
+            )
+        else:
+            move_es_documents(
+                config=config,
+                src_index=src_index,
+                dest_index=dest_index,
+                src_file_id=get_file_id(event.src_path),
+                dest_file_id=get_file_id(event.dest_path),
+                dest_path=event.dest_path,
+            )
+        logging.info(
+            f"MOVE_FINISHED: {event_id} {event.src_path} -> {event.dest_path}."
+        )
+        return True
+    except Exception as e:
+        logging.error(f"MOVE_FAILED: {event_id} {event.src_path} -> {event.dest_path}.")
+        logging.error(f"An unexpected error occurred: {e}")
+        return False
+
+
 def get_or_update_file_cache(config: Config, event: FileSystemEvent | None = None):
     """
     The function `get_or_update_file_cache` creates or updates a file cache stored in a JSON file based
@@ -158,11 +252,50 @@ def get_or_update_file_cache(config: Config, event: FileSystemEvent | None = Non
     return file_cache
 
 
+def remove_from_file_cache(
+    config: Config, src_path: str, dest_path: str | None = None
+) -> dict[str, str]:
+    """
+    The function `remove_from_file_cache` drops the entry of a deleted file from the file cache, or
+    moves it to `dest_path` when the file was renamed.
+
+    :param config: The `config` parameter is an object that contains configuration settings for the
+    application, including the application's home directory holding the file cache
+    :type config: Config
+    :param src_path: The `src_path` parameter is the path of the deleted or moved file
+    :type src_path: str
+    :param dest_path: The `dest_path` parameter is the new path of a moved file. When it is `None` the
+    entry is dropped
+    :type dest_path: str | None
+    :return: The function `remove_from_file_cache` returns the updated file cache dictionary.
+    """
+    file_cache = get_or_update_file_cache(config=config)
+    file_hash = file_cache.pop(src_path, None)
+    if dest_path and file_hash:
+        file_cache[dest_path] = file_hash
+    save_file_cache(config=config, file_cache=file_cache)
+    return file_cache
+
+
+def save_file_cache(config: Config, file_cache: dict[str, str]) -> None:
+    """
+    The function `save_file_cache` writes the file cache to its JSON file.
+
+    :param config: The `config` parameter is an object that contains configuration settings for the
+    application, including the application's home directory holding the file cache
+    :type config: Config
+    :param file_cache: The `file_cache` parameter maps synced file paths to their content hash
+    :type file_cache: dict[str, str]
+    """
+    with open(os.path.join(config.app_home, "file_cache.json"), "w") as f:
+        json.dump(file_cache, f, indent=4)
+
+
 # The `FSHandler` class is a subclass of `FileSystemEventHandler` that processes file system events
 # for supported file extensions and updates a file cache accordingly.
 class FSHandler(FileSystemEventHandler):
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, cluster: ClusterCoordinator | None = None):
         """
         The function initializes an object with a configuration and file cache.
 
@@ -170,11 +303,126 @@ class FSHandler(FileSystemEventHandler):
         the `__init__` method of a class as an argument. The `Config` class likely contains configuration
         settings or parameters that are needed for the functionality of the class
         :type config: Config
+        :param cluster: The `cluster` parameter is the `ClusterCoordinator` of cluster mode. When it is set
+        only the files owned by this node are synced, under a lease, and the synced state is shared with
+        the other nodes
+        :type cluster: ClusterCoordinator | None
         """
         self.file_cache = get_or_update_file_cache(config=config)
         self.config = config
+        self.cluster = cluster
+        # Serializes observer events and cluster rescans.
+        self.lock = threading.RLock()
+        # Lists the source files with their stat tuples from an index kept by the observer, or returns
+        # `None` when it has none yet. The source directory is walked otherwise.
+        self.file_lister: Callable[[], list[tuple[str, FileStat]] | None] | None = None
+        # Rescans are run one at a time by a worker thread, requests made meanwhile are merged.
+        self.rescan_requested = threading.Event()
+        self.rescan_lock = threading.Lock()
+        self.rescan_deletions = True
+        self.rescanned_ring: list[tuple[int, str]] = []
+        self.started_at_ns = time.time_ns()
+        self.rescans_stopped = threading.Event()
+        self.rescan_thread: threading.Thread | None = None
+        if cluster:
+            self.rescan_thread = threading.Thread(
+                target=self.run_rescans, name="cluster-rescan", daemon=True
+            )
+            self.rescan_thread.start()
         super().__init__()
 
+    def dispatch(self, event: FileSystemEvent) -> None:
+        """
+        The `dispatch` method dispatches an event to the matching handler method under the handler lock.
+
+        :param event: The `event` parameter is the `FileSystemEvent` to dispatch
+        :type event: FileSystemEvent
+        """
+        # Events of the cluster state directory are dropped before they wait for the lock.
+        if self.is_excluded(event.src_path) and (
+            not event.dest_path or self.is_excluded(event.dest_path)
+        ):
+            return
+        with self.lock:
+            super().dispatch(event)
+
+    def is_excluded(self, path: str) -> bool:
+        """
+        The `is_excluded` method checks if a path must never be looked at, which is the case of the
+        cluster state directory. It is also given to the scanning observer so it never scans it.
+
+        :param path: The `path` parameter is the path to check
+        :type path: str
+        :return: `True` if the path is excluded, `False` otherwise.
+        """
+        return self.cluster is not None and self.cluster.is_state_path(path)
+
+    def is_supported(self, path: str) -> bool:
+        """
+        The `is_supported` method checks if a path lies within the source directory and has a supported
+        file extension.
+        The cluster state directory is never synced.
+
+        :param path: The `path` parameter is the file path to check
+        :type path: str
+        :return: `True` if the file should be synced, `False` otherwise.
+        """
+        if self.is_excluded(path):
+            return False
+        try:
+            return is_file_extensions_supported(
+                path=path,
+                source_dir=self.config.dataset_source_dir,
+                supported_file_extensions=self.config.dataset_supported_file_extensions,
+            )
+        except ValueError:
+            return False
+
+    def is_owned(self, path: str) -> bool:
+        """
+        The `is_owned` method checks if this instance is responsible for a file. Without cluster mode it
+        is responsible for every file.
+
+        :param path: The `path` parameter is the file path to check
+        :type path: str
+        :return: `True` if this instance should handle the file, `False` otherwise.
+        """
+        return self.cluster is None or self.cluster.is_owner(path)
+
+    def synced_hash(self, path: str) -> str | None:
+        """
+        The `synced_hash` method returns the content hash a file was last synced with, from the shared
+        cluster state in cluster mode and from the file cache otherwise.
+
+        :param path: The `path` parameter is the file path
+        :type path: str
+        :return: The md5 hash or `None` if the file was never synced.
+        """
+        if self.cluster:
+            return self.cluster.synced_hash(path)
+        return self.file_cache.get(path)
+
+    def acquire_lease(self, path: str) -> bool:
+        """
+        The `acquire_lease` method takes the cluster lease of a file. Without cluster mode it always
+        succeeds.
+
+        :param path: The `path` parameter is the file path
+        :type path: str
+        :return: `True` if the file can be handled, `False` if another sync holds it.
+        """
+        return self.cluster is None or self.cluster.acquire_lease(path)
+
+    def release_lease(self, path: str) -> None:
+        """
+        The `release_lease` method gives the cluster lease of a file back.
+
+        :param path: The `path` parameter is the file path
+        :type path: str
+        """
+        if self.cluster:
+            self.cluster.release_lease(path)
+
     def process_event(self, event: FileSystemEvent) -> None:
         """
         The `process_event` function processes a FileSystemEvent by checking if it is a directory, verifying
@@ -189,19 +437,26 @@ class FSHandler(FileSystemEventHandler):
         """
         if event.is_directory:
             return
-        if is_file_extensions_supported(
-            path=event.src_path,
-            source_dir=self.config.dataset_source_dir,
-            supported_file_extensions=self.config.dataset_supported_file_extensions,
-        ):
+        if self.is_supported(event.src_path) and self.is_owned(event.src_path):
             file_hash = hashlib.md5(open(event.src_path, "rb").read()).hexdigest()
-            if self.file_cache.get(event.src_path) == file_hash:
+            if self.synced_hash(event.src_path) == file_hash:
                 logging.info(f"Skipping event for {event.src_path}")
                 return
-            if process_event(config=self.config, event=event):
-                self.file_cache = get_or_update_file_cache(
-                    config=self.config, event=event
-                )
+            if not self.acquire_lease(event.src_path):
+                logging.info(f"Skipping leased event for {event.src_path}")
+                return
+            try:
+                # Another node may have synced the file before the lease was acquired.
+                if self.cluster and self.synced_hash(event.src_path) == file_hash:
+                    return
+                if process_event(config=self.config, event=event):
+                    self.file_cache = get_or_update_file_cache(
+                        config=self.config, event=event
+                    )
+                    if self.cluster:
+                        self.cluster.mark_synced(event.src_path, file_hash)
+            finally:
+                self.release_lease(event.src_path)
 
     def on_created(self, event: FileSystemEvent) -> None:
         """
@@ -225,29 +480,322 @@ class FSHandler(FileSystemEventHandler):
         """
         self.process_event(event=event)
 
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        """
+        The `on_deleted` function removes the documents and the file cache entry of a deleted file.
+
+        :param event: The `event` parameter in the `on_deleted` method is of type `FileSystemEvent`. It
+        represents the deletion of a file in the file system
+        :type event: FileSystemEvent
+        """
+        if event.is_directory or self.synced_hash(event.src_path) is None:
+            return
+        if not self.is_owned(event.src_path) or not self.acquire_lease(event.src_path):
+            return
+        try:
+            if process_delete_event(config=self.config, event=event):
+                self.file_cache = remove_from_file_cache(
+                    config=self.config, src_path=event.src_path
+                )
+                if self.cluster:
+                    self.cluster.forget(event.src_path)
+        finally:
+            self.release_lease(event.src_path)
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        """
+        The `on_moved` function handles a file being moved or renamed. Documents of an already synced file
+        are re-pointed to the new path instead of being re-indexed. A file moved out of the synced set is
+        handled as a deletion and a file moved into it as a creation.
+
+        :param event: The `event` parameter in the `on_moved` method is of type `FileSystemEvent`. Its
+        `src_path` is the old path and its `dest_path` is the new path of the file
+        :type event: FileSystemEvent
+        """
+        if event.is_directory:
+            return
+        tracked = self.synced_hash(event.src_path) is not None
+        if not self.is_supported(event.dest_path):
+            if tracked:
+                self.on_deleted(event=event)
+            return
+        if not tracked:
+            self.process_event(event=FileCreatedEvent(event.dest_path))
+            return
+        if not self.is_owned(event.dest_path) or not self.acquire_lease(
+            event.dest_path
+        ):
+            return
+        try:
+            if process_move_event(config=self.config, event=event):
+                self.file_cache = remove_from_file_cache(
+                    config=self.config,
+                    src_path=event.src_path,
+                    dest_path=event.dest_path,
+                )
+                if self.cluster:
+                    self.cluster.move_state(event.src_path, event.dest_path)
+        finally:
+            self.release_lease(event.dest_path)
+
+    def request_rescan(self, departed: set[str]) -> None:
+        """
+        The `request_rescan` method asks the rescan worker for a rescan after the cluster membership
+        changed. It returns right away, and requests made while a rescan runs are merged into the next one.
+
+        :param departed: The `departed` parameter is the set of nodes which left the cluster. Their
+        deleted files are only looked for when it is not empty
+        :type departed: set[str]
+        """
+        if departed:
+            with self.rescan_lock:
+                self.rescan_deletions = True
+        self.rescan_requested.set()
+
+    def run_rescans(self) -> None:
+        """
+        The `run_rescans` method runs the requested rescans one at a time until `stop_rescans` is called.
+        """
+        while True:
+            self.rescan_requested.wait()
+            self.rescan_requested.clear()
+            if self.rescans_stopped.is_set():
+                return
+            with self.rescan_lock:
+                deletions, self.rescan_deletions = self.rescan_deletions, False
+            try:
+                self.rescan(deletions=deletions)
+            except Exception as e:
+                logging.error(f"CLUSTER_RESCAN_FAILED: {self.cluster.node_id}: {e}")
+                with self.rescan_lock:
+                    self.rescan_deletions |= deletions
+
+    def stop_rescans(self) -> None:
+        """
+        The `stop_rescans` method stops the rescan worker and waits for the file it is syncing, if any.
+        """
+        self.rescans_stopped.set()
+        self.rescan_requested.set()
+        if self.rescan_thread:
+            self.rescan_thread.join()
+
+    def list_files(self) -> Iterable[tuple[str, FileStat | None]]:
+        """
+        The `list_files` method lists the source files, from the index of the observer when it has one
+        and by walking the source directory otherwise.
+
+        :return: The file paths with their stat tuples, or `None` for the stat when it is not known.
+        """
+        files = self.file_lister() if self.file_lister else None
+        if files is not None:
+            yield from files
+            return
+        for root, dirs, file_names in os.walk(self.config.dataset_source_dir):
+            dirs[:] = [
+                d for d in dirs if not self.is_excluded(os.path.join(root, d))
+            ]
+            for file_name in file_names:
+                yield os.path.join(root, file_name), None
+
+    def adopt(self, path: str, stat: FileStat | None) -> bool:
+        """
+        The `adopt` method decides what a rescan does with an owned file without shared state. A file in
+        the local file cache was synced before cluster mode was enabled, so its state is seeded from the
+        cache if its content did not change. Any other file is only synced if it changed after this node
+        started, e.g. while its owner was dying: like without cluster mode, files that already existed are
+        left to the backfill command.
+
+        :param path: The `path` parameter is the file path
+        :type path: str
+        :param stat: The `stat` parameter is the stat tuple of the file, or `None` if it is not known
+        :type stat: FileStat | None
+        :return: `True` if the file must be synced, `False` otherwise.
+        """
+        cached_hash = self.file_cache.get(path)
+        if cached_hash is None:
+            mtime_ns = stat[3] if stat else os.stat(path).st_mtime_ns
+            return mtime_ns >= self.started_at_ns
+        file_hash = hashlib.md5(open(path, "rb").read()).hexdigest()
+        if file_hash != cached_hash:
+            return True
+        with self.lock:
+            if self.acquire_lease(path):
+                try:
+                    if self.synced_hash(path) is None:
+                        self.cluster.mark_synced(path, file_hash)
+                finally:
+                    self.release_lease(path)
+        return False
+
+    def rescan(self, deletions: bool = True) -> None:
+        """
+        The `rescan` method picks up the files this node owns after the cluster membership changed, e.g.
+        the files of a node that died. Only the files this node did not own at the previous rescan are
+        checked, the others were kept up to date by events. Those that changed since they were synced
+        are synced, files without shared state are handled by `adopt`, and owned files that were deleted
+        in the meantime are removed.
+
+        :param deletions: The `deletions` parameter tells if the shared state of every file is read to
+        find the deleted ones. It is only needed on joining and after nodes left the cluster
+        :type deletions: bool
+        """
+        ring = self.cluster.ring
+        logging.info(f"CLUSTER_RESCAN_STARTED: {self.cluster.node_id}.")
+        present: set[str] = set()
+        for path, stat in self.list_files():
+            if self.rescans_stopped.is_set():
+                return
+            try:
+                if not self.is_supported(path):
+                    continue
+                if deletions:
+                    present.add(path)
+                if not self.is_owned(path):
+                    continue
+                if (
+                    self.rescanned_ring
+                    and self.cluster.owner(path, self.rescanned_ring) == self.cluster.node_id
+                ):
+                    continue
+                if self.cluster.is_unchanged(path, stat[2:] if stat else None):
+                    continue
+                if self.synced_hash(path) is None and not self.adopt(path, stat):
+                    continue
+                with self.lock:
+                    self.process_event(event=FileCreatedEvent(path))
+            except Exception as e:
+                logging.error(f"CLUSTER_RESCAN_FAILED: {path}: {e}")
+        if deletions:
+            for root, _, files in os.walk(self.cluster.files_dir):
+                for file_name in files:
+                    if self.rescans_stopped.is_set():
+                        return
+                    if not file_name.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(root, file_name)) as f:
+                            path = json.load(f)["path"]
+                        if (
+                            path not in present
+                            and self.is_owned(path)
+                            and not os.path.exists(path)
+                        ):
+                            with self.lock:
+                                self.on_deleted(event=FileDeletedEvent(path))
+                    except Exception as e:
+                        logging.error(f"CLUSTER_RESCAN_FAILED: {file_name}: {e}")
+        self.rescanned_ring = ring
+        logging.info(f"CLUSTER_RESCAN_FINISHED: {self.cluster.node_id}.")
+
+
+def reload_config(
+    event_handler: FSHandler,
+    observer: BaseObserver,
+    watch: ObservedWatch,
+    config_file_path: str,
+) -> ObservedWatch:
+    """
+    The function `reload_config` re-reads the configuration file and applies it to the running daemon.
+    Chunk size, worker and thread counts and Elasticsearch settings are picked up by the next file
+    synced; the file being synced finishes with the settings it started with and queued events are
+    kept. New scanner settings apply to the next scan. A changed `dataset_source_dir` is re-scheduled
+    on the observer. An invalid configuration is
+    logged and the current one is kept.
 
-def start_sync(config: Config) -> None:
+    :param event_handler: The `event_handler` parameter is the `FSHandler` the observer dispatches to
+    :type event_handler: FSHandler
+    :param observer: The `observer` parameter is the running watchdog observer
+    :type observer: BaseObserver
+    :param watch: The `watch` parameter is the observer watch of the current source directory
+    :type watch: ObservedWatch
+    :param config_file_path: The `config_file_path` parameter is the path to the configuration file
+    :type config_file_path: str
+    :return: The observer watch of the source directory, which is a new one if the directory changed.
+    """
+    try:
+        config = toml_conf_reader(config_file_path)
+        if config.es_index_strategy == "data_stream":
+            put_es_data_stream_template(config)
+    except Exception as e:
+        logging.error(f"CONFIG_RELOAD_FAILED: {config_file_path}: {e}")
+        return watch
+    if config.dataset_source_dir != event_handler.config.dataset_source_dir:
+        observer.unschedule(watch)
+        watch = observer.schedule(
+            event_handler, path=config.dataset_source_dir, recursive=True
+        )
+    event_handler.config = config
+    if isinstance(observer, ScanningObserver):
+        observer.update_config(config)
+    logging.info(f"CONFIG_RELOADED: {config_file_path}")
+    return watch
+
+
+def start_sync(config: Config, config_file_path: str | None = None) -> None:
     """
     The function `start_sync` sets up a file system event handler to monitor a directory for changes and
-    runs indefinitely until interrupted by a keyboard interrupt.
+    runs indefinitely until interrupted by a keyboard interrupt. The configuration is reloaded on
+    SIGHUP or when the configuration file changes. With `cluster_enabled` the instance joins the
+    cluster sharing the source directory and only syncs the files it owns.
 
     :param config: The `config` parameter is an object of type `Config`, which is likely a custom class
     or data structure containing configuration settings for the synchronization process. It may include
     attributes such as `dataset_source_dir` which is the path to the directory that needs to be
     monitored for changes
     :type config: Config
+    :param config_file_path: The `config_file_path` parameter is the configuration file to reload. It
+    defaults to `config.app_config_file_path`
+    :type config_file_path: str | None
     """
-    event_handler = FSHandler(config)
-    observer = Observer()
-    observer.schedule(event_handler, path=config.dataset_source_dir, recursive=True)
+    config_file_path = config_file_path or str(config.app_config_file_path)
+    cluster = ClusterCoordinator(config) if config.cluster_enabled else None
+    event_handler = FSHandler(config, cluster=cluster)
+    observer = (
+        ScanningObserver(config, exclude=event_handler.is_excluded)
+        if config.dataset_observer == "scanner"
+        else Observer()
+    )
+    watch = observer.schedule(
+        event_handler, path=config.dataset_source_dir, recursive=True
+    )
+    if isinstance(observer, ScanningObserver):
+        event_handler.file_lister = observer.indexed_files
+    # Join the cluster first so events delivered by the observer are checked against a built ring.
+    if cluster:
+        cluster.start(on_rebalance=event_handler.request_rescan)
     observer.start()
 
+    reload_requested = threading.Event()
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_requested.set())
+    config_mtime = os.path.getmtime(config_file_path)
     try:
         while True:
             time.sleep(1)
+            try:
+                mtime = os.path.getmtime(config_file_path)
+            except OSError:
+                mtime = config_mtime
+            if mtime != config_mtime:
+                config_mtime = mtime
+                reload_requested.set()
+            if reload_requested.is_set():
+                reload_requested.clear()
+                watch = reload_config(
+                    event_handler=event_handler,
+                    observer=observer,
+                    watch=watch,
+                    config_file_path=config_file_path,
+                )
     except KeyboardInterrupt:
+        pass
+    finally:
+        # Syncs in progress must be over before the cluster gives their leases back.
         observer.stop()
-    observer.join()
+        observer.join()
+        event_handler.stop_rescans()
+        if cluster:
+            cluster.stop()
 
 
 def stop_sync():
@@ -259,6 +807,278 @@ def stop_sync():
     observer.join()
 
 
+def discover_files(
+    source_dir: str, include: list[str], exclude: list[str]
+) -> Generator[str, Any, None]:
+    """
+    The function `discover_files` walks a directory tree and yields the files matching the include
+    globs and none of the exclude globs. Globs are matched against the path relative to `source_dir`.
+
+    :param source_dir: The `source_dir` parameter is the root of the directory tree to walk
+    :type source_dir: str
+    :param include: The `include` parameter is the list of glob patterns a file must match one of
+    :type include: list[str]
+    :param exclude: The `exclude` parameter is the list of glob patterns excluding a file
+    :type exclude: list[str]
+    """
+    for root, _, files in os.walk(source_dir):
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(path, source_dir)
+            if not any(fnmatch.fnmatch(relative_path, pattern) for pattern in include):
+                continue
+            if any(fnmatch.fnmatch(relative_path, pattern) for pattern in exclude):
+                continue
+            yield path
+
+
+# The `BackfillProgress` class keeps the counters of a backfill run and renders them as a progress
+# bar with throughput and ETA on stderr.
+class BackfillProgress:
+
+    def __init__(self, total_files: int, total_bytes: int):
+        """
+        The function initializes the progress counters of a backfill run.
+
+        :param total_files: The `total_files` parameter is the number of files discovered
+        :type total_files: int
+        :param total_bytes: The `total_bytes` parameter is the size of all files discovered, used to
+        estimate the remaining time
+        :type total_bytes: int
+        """
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.rows = 0
+        self.synced = 0
+        self.skipped = 0
+        self.failed: list[str] = []
+        self.start_time = time.monotonic()
+
+    @property
+    def done_files(self) -> int:
+        """
+        The `done_files` property returns the number of files processed so far, whatever the outcome.
+        """
+        return self.synced + self.skipped + len(self.failed)
+
+    def update(self, status: str, path: str, size: int, rows: int = 0) -> None:
+        """
+        The `update` method records the outcome of one file and redraws the progress bar.
+
+        :param status: The `status` parameter is one of `synced`, `skipped` or `failed`
+        :type status: str
+        :param path: The `path` parameter is the path of the file
+        :type path: str
+        :param size: The `size` parameter is the size of the file in bytes
+        :type size: int
+        :param rows: The `rows` parameter is the number of records loaded from the file
+        :type rows: int
+        """
+        match status:
+            case "synced":
+                self.synced += 1
+            case "skipped":
+                self.skipped += 1
+            case _:
+                self.failed.append(path)
+        self.done_bytes += size
+        self.rows += rows
+        self.render()
+
+    def render(self) -> None:
+        """
+        The `render` method draws the progress bar with file count, rows, rows/s and ETA on stderr.
+        """
+        elapsed = time.monotonic() - self.start_time
+        ratio = self.done_bytes / self.total_bytes if self.total_bytes else 1
+        eta = (
+            datetime.timedelta(seconds=int(elapsed / ratio - elapsed)) if ratio else "-"
+        )
+        bar = "#" * int(ratio * 30)
+        sys.stderr.write(
+            f"\r[{bar:<30}] {self.done_files}/{self.total_files} files"
+            f" | {self.rows} rows | {self.rows / elapsed if elapsed else 0:.0f} rows/s"
+            f" | ETA {eta}  "
+        )
+        sys.stderr.flush()
+
+    def summary(self) -> str:
+        """
+        The `summary` method returns the final report of the backfill run.
+
+        :return: A multi-line summary with counters, duration and the failed files.
+        """
+        elapsed = time.monotonic() - self.start_time
+        lines = [
+            f"Backfill finished in {datetime.timedelta(seconds=int(elapsed))}: "
+            f"{self.synced} synced, {self.skipped} skipped, {len(self.failed)} failed, "
+            f"{self.rows} rows ({self.rows / elapsed if elapsed else 0:.0f} rows/s).",
+            *(f"FAILED: {path}" for path in self.failed),
+        ]
+        return "\n".join(lines)
+
+
+def backfill_file(
+    config: Config,
+    path: str,
+    file_cache: dict[str, str],
+    cluster: ClusterCoordinator | None = None,
+) -> tuple[str, str, int]:
+    """
+    The function `backfill_file` syncs one file of a backfill run unless it is already in the file
+    cache with the same content hash. In cluster mode the shared synced state is checked instead, the
+    file is synced under its lease and recorded in the shared state, like the daemons do.
+
+    :param config: The `config` parameter is of type `Config` and holds the sync settings
+    :type config: Config
+    :param path: The `path` parameter is the path of the file to sync
+    :type path: str
+    :param file_cache: The `file_cache` parameter is the file cache loaded at the start of the run
+    :type file_cache: dict[str, str]
+    :param cluster: The `cluster` parameter is the `ClusterCoordinator` of cluster mode
+    :type cluster: ClusterCoordinator | None
+    :return: A tuple of the status (`synced`, `skipped` or `failed`), the file hash and the number of
+    records loaded. A file leased by a daemon is skipped, the daemon syncs it.
+    """
+    event_id = uuid.uuid4().hex
+    try:
+        file_hash = hashlib.md5(open(path, "rb").read()).hexdigest()
+        synced_hash = cluster.synced_hash(path) if cluster else file_cache.get(path)
+        if synced_hash == file_hash:
+            return "skipped", file_hash, 0
+        if cluster and not cluster.acquire_lease(path):
+            return "skipped", file_hash, 0
+        try:
+            # A daemon may have synced the file before the lease was acquired.
+            if cluster and cluster.synced_hash(path) == file_hash:
+                return "skipped", file_hash, 0
+            logging.info(f"SYNC_STARTED: {event_id} {path}.")
+            start_time = datetime.datetime.now()
+            rows = DatasetProcessor(
+                source_file=path, config=config, event_id=event_id
+            ).es_sync()
+            if cluster:
+                cluster.mark_synced(path, file_hash)
+            logging.info(
+                f"SYNC_FINISHED: {event_id} [duration: {datetime.datetime.now() - start_time}] {path}."
+            )
+            return "synced", file_hash, rows
+        finally:
+            if cluster:
+                cluster.release_lease(path)
+    except Exception as e:
+        logging.error(f"SYNC_FAILED: {event_id} {path}.")
+        logging.error(f"An unexpected error occurred: {e}")
+        return "failed", "", 0
+
+
+def start_backfill(
+    config: Config,
+    source_dir: str,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    parallel_files: int = 4,
+) -> int:
+    """
+    The function `start_backfill` syncs every existing file under a directory once, several files in
+    parallel, skipping files already in the file cache, and prints a summary.
+
+    With `cluster_enabled` the run goes through the leases and the shared synced state of the cluster,
+    so it can run next to the daemons without syncing a file twice. It does not join the hashing ring:
+    it covers every file once and exits, so taking a share of the files would only move them back and
+    forth between the daemons.
+
+    :param config: The `config` parameter is of type `Config` and holds the sync settings
+    :type config: Config
+    :param source_dir: The `source_dir` parameter is the directory tree to backfill
+    :type source_dir: str
+    :param include: The `include` parameter is the list of glob patterns of files to sync. It defaults
+    to the supported file extensions
+    :type include: list[str] | None
+    :param exclude: The `exclude` parameter is the list of glob patterns of files to leave out
+    :type exclude: list[str] | None
+    :param parallel_files: The `parallel_files` parameter is the number of files synced in parallel
+    :type parallel_files: int
+    :return: The process exit status, `0` if every file was synced or skipped, `130` if the run was
+    interrupted and `1` otherwise.
+    """
+    source_dir = os.path.abspath(source_dir)
+    include = include or [
+        f"*.{extension}" for extension in config.dataset_supported_file_extensions
+    ]
+    cluster = (
+        ClusterCoordinator(config, node_suffix=f"-backfill-{os.getpid()}")
+        if config.cluster_enabled
+        else None
+    )
+    files = {
+        path: os.path.getsize(path)
+        for path in discover_files(source_dir, include=include, exclude=exclude or [])
+        if not (cluster and cluster.is_state_path(path))
+    }
+    file_cache = get_or_update_file_cache(config=config)
+    progress = BackfillProgress(
+        total_files=len(files), total_bytes=sum(files.values())
+    )
+    if cluster:
+        cluster.start(member=False)
+    progress.render()
+
+    def record(future: Future, path: str) -> None:
+        """
+        The function `record` records the outcome of a finished file in the progress and file cache.
+        """
+        status, file_hash, rows = future.result()
+        progress.update(status=status, path=path, size=files[path], rows=rows)
+        if status == "synced":
+            file_cache[path] = file_hash
+            # Persist progress regularly so an interrupted run resumes where it stopped.
+            if progress.synced % 100 == 0:
+                save_file_cache(config=config, file_cache=file_cache)
+
+    executor = ThreadPoolExecutor(
+        max_workers=parallel_files, thread_name_prefix="backfill"
+    )
+    pending: dict[Future, str] = {}
+    remaining = iter(files)
+    interrupted = False
+    try:
+        while True:
+            # Only a window of files is queued, the others are submitted as files complete.
+            for path in itertools.islice(remaining, 2 * parallel_files - len(pending)):
+                pending[
+                    executor.submit(backfill_file, config, path, file_cache, cluster)
+                ] = path
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record(future, pending.pop(future))
+    except KeyboardInterrupt:
+        interrupted = True
+        sys.stderr.write("\nInterrupted, waiting for the files being synced.\n")
+        executor.shutdown(cancel_futures=True)
+        for future, path in pending.items():
+            if not future.cancelled():
+                record(future, path)
+    finally:
+        executor.shutdown()
+        # The leases are only given back once no file is being synced anymore.
+        if cluster:
+            cluster.stop()
+        save_file_cache(config=config, file_cache=file_cache)
+    sys.stderr.write("\n")
+    print(progress.summary())
+    logging.info(progress.summary())
+    if interrupted:
+        logging.warning(
+            f"BACKFILL_INTERRUPTED: {progress.done_files}/{progress.total_files} files done."
+        )
+        return 130
+    return 1 if progress.failed else 0
+
+
 def main():
     """
     The `main` function in this Python script parses command line arguments, retrieves configuration
@@ -281,12 +1101,49 @@ def main():
     parser.add_argument(
         "-v", "--version", required=False, action="store_true", help="Show version"
     )
+    subparsers = parser.add_subparsers(dest="command", metavar="<command>")
+    backfill_parser = subparsers.add_parser(
+        "backfill",
+        help="Sync existing files under a directory once and exit.",
+        description="Sync existing files under a directory once and exit. Files already in the "
+        "file cache are skipped. Exits with a non-zero status if any file failed.",
+    )
+    backfill_parser.add_argument(
+        "dir", type=str, help="Directory to backfill.", metavar="<dir>"
+    )
+    backfill_parser.add_argument(
+        "-i",
+        "--include",
+        action="append",
+        type=str,
+        help="Glob of files to sync, relative to <dir>. Repeatable. default: supported file extensions",
+        metavar="<glob>",
+    )
+    backfill_parser.add_argument(
+        "-e",
+        "--exclude",
+        action="append",
+        type=str,
+        help="Glob of files to leave out, relative to <dir>. Repeatable.",
+        metavar="<glob>",
+    )
+    backfill_parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=4,
+        help="Number of files synced in parallel. default: 4",
+        metavar="<n>",
+    )
 
     args = parser.parse_args()
     if args.version:
         print(f"fs2elastic: {get_version()}")
     else:
-        config = get_config(args.config) if args.config else get_config()
+        config_file_path = (
+            args.config if args.config else defaults["AppConfig"]["app_config_file_path"]
+        )
+        config = get_config(config_file_path)
         try:
             init_logger(
                 log_file_path=config.log_file_path,
@@ -295,7 +1152,19 @@ def main():
             )
 
             logging.info(get_es_connection(config).info())
-            start_sync(config)
+            if config.es_index_strategy == "data_stream":
+                put_es_data_stream_template(config)
+            if args.command == "backfill":
+                sys.exit(
+                    start_backfill(
+                        config,
+                        source_dir=args.dir,
+                        include=args.include,
+                        exclude=args.exclude,
+                        parallel_files=args.parallel,
+                    )
+                )
+            start_sync(config, config_file_path=config_file_path)
         except Exception as e:
             logging.error(f"Error connecting to the remote host: {e}")
             raise Exception(f"Error connecting to the remote host: {e}")
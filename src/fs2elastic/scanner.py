@@ -0,0 +1,377 @@
+import os
+import time
+import zlib
+import logging
+import threading
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.events import (
+    FileSystemEvent,
+    FileCreatedEvent,
+    FileModifiedEvent,
+    FileDeletedEvent,
+    FileMovedEvent,
+)
+from watchdog.observers.api import (
+    BaseObserver,
+    EventEmitter,
+    DEFAULT_OBSERVER_TIMEOUT,
+    DEFAULT_EMITTER_TIMEOUT,
+)
+from fs2elastic.typings import Config
+
+
+# Stat tuple of an indexed file: (st_dev, st_ino, st_size, st_mtime_ns).
+FileStat = tuple[int, int, int, int]
+
+
+# The `IOBudget` class is a token bucket limiting the number of filesystem operations (directory
+# listings and stats) the scanner issues per second, shared by all scanning threads.
+class IOBudget:
+
+    def __init__(self, ops_per_second: int):
+        """
+        The function initializes the token bucket.
+
+        :param ops_per_second: The `ops_per_second` parameter is the maximum number of filesystem
+        operations per second. `0` disables the limit
+        :type ops_per_second: int
+        """
+        self.ops_per_second = ops_per_second
+        self.tokens = float(ops_per_second)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        The `acquire` method blocks until one filesystem operation is allowed.
+        """
+        if self.ops_per_second <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                float(self.ops_per_second),
+                self.tokens + (now - self.updated_at) * self.ops_per_second,
+            )
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.ops_per_second if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+# The `ScanningEmitter` class emits file system events for a directory tree by scanning it, for network
+# filesystems (NFS, SMB) which do not deliver inotify events. It keeps an in-memory index of directory
+# mtimes and file stat tuples so a scan only lists the directories whose mtime changed.
+class ScanningEmitter(EventEmitter):
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT, **kwargs):
+        """
+        The function initializes the emitter with an empty index. The first scan builds the index
+        without emitting events, like a native observer which only reports changes made after it
+        started.
+
+        :param event_queue: The `event_queue` parameter is the observer queue events are put on
+        :param watch: The `watch` parameter is the observed watch holding the directory to scan
+        :param timeout: The `timeout` parameter is the emitter timeout of the observer
+        """
+        self.observer: ScanningObserver = kwargs.pop("observer")
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        self.dirs: dict[str, int] = {}
+        self.files: dict[str, dict[str, FileStat]] = {}
+        self.subdirs: dict[str, set[str]] = {}
+        # Files created or modified by the previous scan, re-stat'ed until they stop changing since
+        # writes to an existing file do not change the mtime of its directory.
+        self.hot: set[str] = set()
+        self.scan_count = 0
+        self.indexed = False
+
+    @property
+    def config(self) -> Config:
+        """
+        The `config` property returns the current configuration of the observer.
+        """
+        return self.observer.config
+
+    def queue_events(self, timeout: float) -> None:
+        """
+        The `queue_events` method builds the index on the first call and then scans the tree every
+        `dataset_scan_interval` seconds, queueing the events found.
+
+        :param timeout: The `timeout` parameter is unused, the scan interval comes from the config
+        :type timeout: float
+        """
+        if self.scan_count and self.stopped_event.wait(self.config.dataset_scan_interval):
+            return
+        start_time = time.monotonic()
+        try:
+            events = self.scan()
+        except Exception as e:
+            logging.error(f"SCAN_FAILED: {self.watch.path}: {e}")
+            return
+        if self.indexed:
+            for event in events:
+                self.queue_event(event)
+        else:
+            # The baseline reports every file as created, none of them is being written.
+            self.hot.clear()
+        logging.info(
+            f"SCAN_FINISHED: {self.watch.path} [duration: {time.monotonic() - start_time:.2f}s] "
+            f"{len(self.dirs)} dirs, {sum(map(len, self.files.values()))} files, "
+            f"{len(events) if self.indexed else 0} events."
+        )
+        self.indexed = True
+
+    def indexed_files(self) -> list[tuple[str, FileStat]]:
+        """
+        The `indexed_files` method returns the files of the index with their stat tuples. It is safe to
+        call from another thread while a scan runs.
+
+        :return: A list of file paths and stat tuples.
+        """
+        return [
+            (os.path.join(path, name), stat)
+            for path, files in list(self.files.items())
+            for name, stat in list(files.items())
+        ]
+
+    def stat_dir(self, path: str) -> int | None:
+        """
+        The `stat_dir` method returns the mtime of a directory.
+
+        :param path: The `path` parameter is the directory path
+        :type path: str
+        :return: The mtime in nanoseconds or `None` if the directory is gone.
+        """
+        self.observer.budget.acquire()
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def stat_file(self, path: str) -> FileStat | None:
+        """
+        The `stat_file` method returns the stat tuple of a file.
+
+        :param path: The `path` parameter is the file path
+        :type path: str
+        :return: The stat tuple or `None` if the file is gone.
+        """
+        self.observer.budget.acquire()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def list_dir(self, path: str) -> tuple[int, dict[str, FileStat], set[str]] | None:
+        """
+        The `list_dir` method lists a directory with `os.scandir`. The directory mtime is read before
+        listing, so a change made during the listing is picked up by the next scan.
+
+        :param path: The `path` parameter is the directory path
+        :type path: str
+        :return: A tuple of the directory mtime, the stat tuples of its files by name and the names of
+        its sub directories, or `None` if the directory is gone.
+        """
+        mtime = self.stat_dir(path)
+        if mtime is None:
+            return None
+        self.observer.budget.acquire()
+        files: dict[str, FileStat] = {}
+        subdirs: set[str] = set()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if self.observer.exclude and self.observer.exclude(entry.path):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.name)
+                    elif entry.is_file():
+                        self.observer.budget.acquire()
+                        stat = entry.stat()
+                        files[entry.name] = (
+                            stat.st_dev,
+                            stat.st_ino,
+                            stat.st_size,
+                            stat.st_mtime_ns,
+                        )
+        except OSError:
+            return None
+        return mtime, files, subdirs
+
+    def drop_dir(self, path: str, deleted: dict[str, FileStat]) -> None:
+        """
+        The `drop_dir` method removes a vanished directory and everything below it from the index.
+
+        :param path: The `path` parameter is the directory path
+        :type path: str
+        :param deleted: The `deleted` parameter collects the files that were indexed below the directory
+        :type deleted: dict[str, FileStat]
+        """
+        for name, stat in self.files.pop(path, {}).items():
+            deleted[os.path.join(path, name)] = stat
+        for name in self.subdirs.pop(path, set()):
+            self.drop_dir(os.path.join(path, name), deleted)
+        self.dirs.pop(path, None)
+
+    def scan(self) -> list[FileSystemEvent]:
+        """
+        The `scan` method updates the index and returns the changes since the previous scan.
+
+        Every indexed directory is stat'ed, and only the directories whose mtime changed are listed again,
+        new sub directories included. Files created or modified by the previous scan are re-stat'ed
+        until they stop changing. Writes to an existing file do not change its directory mtime, so on
+        every scan a rotating slice of `1 / dataset_scan_full_every` of the other files is re-stat'ed as
+        well; every file is checked once per `dataset_scan_full_every` scans. A deleted and a created
+        file with the same inode are reported as a move. Filesystem calls are spread over
+        `dataset_scan_threads` threads.
+
+        :return: The list of deleted, moved, created and modified file events.
+        """
+        self.scan_count += 1
+        slices = self.config.dataset_scan_full_every
+        created: dict[str, FileStat] = {}
+        modified: dict[str, FileStat] = {}
+        deleted: dict[str, FileStat] = {}
+        listed: set[str] = set()
+        with ThreadPoolExecutor(
+            max_workers=self.config.dataset_scan_threads, thread_name_prefix="scanner"
+        ) as executor:
+            known_dirs = list(self.dirs)
+            pending = [os.fspath(self.watch.path)] if not known_dirs else []
+            for path, mtime in zip(known_dirs, executor.map(self.stat_dir, known_dirs)):
+                if path not in self.dirs:
+                    # Already dropped with a vanished parent directory.
+                    continue
+                if mtime is None:
+                    self.drop_dir(path, deleted)
+                elif mtime != self.dirs[path]:
+                    pending.append(path)
+            while pending:
+                next_pending = []
+                for path, listing in zip(pending, executor.map(self.list_dir, pending)):
+                    if listing is None:
+                        self.drop_dir(path, deleted)
+                        continue
+                    mtime, files, subdirs = listing
+                    old_files = self.files.get(path, {})
+                    old_subdirs = self.subdirs.get(path, set())
+                    for name, stat in files.items():
+                        old_stat = old_files.get(name)
+                        file_path = os.path.join(path, name)
+                        if old_stat is None:
+                            created[file_path] = stat
+                        elif old_stat[:2] != stat[:2]:
+                            # Replaced by another file, e.g. renamed over.
+                            deleted[file_path] = old_stat
+                            created[file_path] = stat
+                        elif old_stat != stat:
+                            modified[file_path] = stat
+                    for name in old_files.keys() - files.keys():
+                        deleted[os.path.join(path, name)] = old_files[name]
+                    for name in old_subdirs - subdirs:
+                        self.drop_dir(os.path.join(path, name), deleted)
+                    next_pending.extend(
+                        os.path.join(path, name) for name in subdirs - old_subdirs
+                    )
+                    self.dirs[path] = mtime
+                    self.files[path] = files
+                    self.subdirs[path] = subdirs
+                    listed.add(path)
+                pending = next_pending
+            candidates = [
+                path for path in self.hot if os.path.dirname(path) not in listed
+            ]
+            if slices > 0:
+                # Rotating slice of the index, so every file is re-stat'ed once per `slices` scans.
+                current_slice = self.scan_count % slices
+                candidates.extend(
+                    file_path
+                    for path, files in self.files.items()
+                    if path not in listed
+                    for name in files
+                    if (file_path := os.path.join(path, name)) not in self.hot
+                    and zlib.crc32(file_path.encode()) % slices == current_slice
+                )
+            for path, stat in zip(candidates, executor.map(self.stat_file, candidates)):
+                directory, name = os.path.split(path)
+                old_stat = self.files.get(directory, {}).get(name)
+                # A vanished file also changes its directory mtime and is reported by the next scan.
+                if old_stat is None or stat is None or old_stat == stat:
+                    continue
+                modified[path] = stat
+                self.files[directory][name] = stat
+
+        moved: dict[str, str] = {}
+        deleted_by_inode = {stat[:2]: path for path, stat in deleted.items()}
+        for path, stat in list(created.items()):
+            src_path = deleted_by_inode.pop(stat[:2], None)
+            if src_path:
+                moved[src_path] = path
+                del deleted[src_path]
+                del created[path]
+        # Deletions go first so a file renamed over an existing one replaces it.
+        events: list[FileSystemEvent] = [FileDeletedEvent(path) for path in deleted]
+        events.extend(FileMovedEvent(src, dest) for src, dest in moved.items())
+        events.extend(FileCreatedEvent(path) for path in created)
+        events.extend(FileModifiedEvent(path) for path in modified)
+        self.hot = set(created) | set(modified) | set(moved.values())
+        return events
+
+
+# The `ScanningObserver` class is a watchdog observer running a `ScanningEmitter` per scheduled
+# directory. It is a drop in replacement for the native `Observer` on network filesystems.
+class ScanningObserver(BaseObserver):
+
+    def __init__(
+        self,
+        config: Config,
+        exclude: Callable[[str], bool] | None = None,
+        timeout: float = DEFAULT_OBSERVER_TIMEOUT,
+    ):
+        """
+        The function initializes the observer with the scanner settings.
+
+        :param config: The `config` parameter is of type `Config` and holds the `dataset_scan_*`
+        settings. It can be replaced on a running observer to apply new settings on the next scan
+        :type config: Config
+        :param exclude: The `exclude` parameter is a predicate on paths. Excluded files and directories
+        are neither listed nor indexed, e.g. the cluster state directory
+        :type exclude: Callable[[str], bool] | None
+        :param timeout: The `timeout` parameter is the observer timeout
+        :type timeout: float
+        """
+        self.config = config
+        self.exclude = exclude
+        self.budget = IOBudget(config.dataset_scan_io_budget)
+        super().__init__(self.create_emitter, timeout=timeout)
+
+    def create_emitter(self, event_queue, watch, **kwargs) -> ScanningEmitter:
+        """
+        The `create_emitter` method creates the emitter of a scheduled directory, bound to this observer.
+        """
+        return ScanningEmitter(event_queue, watch, observer=self, **kwargs)
+
+    def indexed_files(self) -> list[tuple[str, FileStat]] | None:
+        """
+        The `indexed_files` method returns the files of the in-memory index of every scheduled directory,
+        so the tree can be listed without walking it again.
+
+        :return: A list of file paths and stat tuples, or `None` while a directory is not indexed yet.
+        """
+        emitters = list(self.emitters)
+        if not emitters or not all(emitter.indexed for emitter in emitters):
+            return None
+        return [item for emitter in emitters for item in emitter.indexed_files()]
+
+    def update_config(self, config: Config) -> None:
+        """
+        The `update_config` method applies new scanner settings from the next scan on.
+
+        :param config: The `config` parameter is the new configuration
+        :type config: Config
+        """
+        self.config = config
+        self.budget = IOBudget(config.dataset_scan_io_budget)
@@ -1,5 +1,5 @@
-import os, pwd
-from typing import Annotated
+import os, pwd, string
+from typing import Annotated, Literal
 from pydantic import (
     BaseModel,
     FilePath,
@@ -7,6 +7,7 @@ from pydantic import (
     HttpUrl,
     TypeAdapter,
     BeforeValidator,
+    AfterValidator,
 )
 
 
@@ -19,6 +20,32 @@ HttpUrlString = Annotated[
 ]
 
 
+# Placeholders accepted by `es_index_template`, see `fs2elastic.dataset_processor.get_index_name`.
+INDEX_TEMPLATE_PLACEHOLDERS = {"prefix", "dir", "top_dir", "name", "ext"}
+
+
+def validate_index_template(value: str) -> str:
+    """
+    The function `validate_index_template` checks that an index template only uses the supported
+    placeholders, so a typo is reported when the configuration is loaded instead of on every event.
+
+    :param value: The `value` parameter is the index template
+    :type value: str
+    :return: The unchanged template.
+    """
+    for _, field_name, _, _ in string.Formatter().parse(value):
+        if field_name is not None and field_name not in INDEX_TEMPLATE_PLACEHOLDERS:
+            raise ValueError(
+                f"unknown placeholder {{{field_name}}}, "
+                f"expected one of {sorted(INDEX_TEMPLATE_PLACEHOLDERS)}"
+            )
+    return value
+
+
+# The `IndexTemplateString` type alias is a string validated by `validate_index_template`.
+IndexTemplateString = Annotated[str, AfterValidator(validate_index_template)]
+
+
 # define variable `fs2elastic_home` that represents the home directory path for a application
 fs2elastic_home = os.path.join(pwd.getpwuid(os.getuid()).pw_dir, ".fs2elastic")
 
@@ -37,6 +64,11 @@ class DatasetConfig(BaseModel):
     dataset_max_workers: int = 1
     dataset_threads_per_worker: int = 10
     dataset_chunk_size: int = 200
+    dataset_observer: Literal["native", "scanner"] = "native"
+    dataset_scan_interval: int = 30
+    dataset_scan_threads: int = 8
+    dataset_scan_io_budget: int = 0
+    dataset_scan_full_every: int = 10
 
 
 # This Python class defines configuration settings for connecting to an Elasticsearch cluster.
@@ -46,6 +78,8 @@ class ESConfig(BaseModel):
     es_password: str = ""
     es_timeout: int = 300
     es_index_prefix: str = "fs2elastic-"
+    es_index_strategy: Literal["file", "shared", "data_stream"] = "file"
+    es_index_template: IndexTemplateString = "{prefix}{dir}"
     es_ssl_ca: FilePath | None = None
     es_verify_certs: bool = False
 
@@ -58,8 +92,19 @@ class LogConfig(BaseModel):
     log_backup_count: int = 5
 
 
-# The class `Config` inherits from `AppConfig`, `DatasetConfig`, `ESConfig`, and `LogConfig` to create a consolidated config class, with the
-# additional configuration setting `extra = "forbid"`.
-class Config(AppConfig, DatasetConfig, ESConfig, LogConfig):
+# The class `ClusterConfig` defines the settings of cluster mode, where several instances share a source
+# directory and split its files between them.
+class ClusterConfig(BaseModel):
+    cluster_enabled: bool = False
+    cluster_node_id: str = ""
+    cluster_state_dir: str = ""
+    cluster_lease_ttl: int = 60
+    cluster_heartbeat_interval: int = 10
+
+
+# The class `Config` inherits from `AppConfig`, `DatasetConfig`, `ESConfig`, `LogConfig` and
+# `ClusterConfig` to create a consolidated config class, with the additional configuration setting
+# `extra = "forbid"`.
+class Config(AppConfig, DatasetConfig, ESConfig, LogConfig, ClusterConfig):
     class Config:
         extra = "forbid"